@@ -4,102 +4,225 @@ Script to download and analyze GitHub Actions artifacts
 This allows the AI to inspect test results from workflow runs
 """
 
+import io
 import os
 import sys
 import json
+import atexit
+import fnmatch
+import hashlib
+import shutil
+import posixpath
 import zipfile
+import tempfile
 import requests
+from requests.adapters import HTTPAdapter
 from pathlib import Path
+from collections import deque
+from urllib.parse import urlencode
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import argparse
 
-def get_workflow_runs(token, owner, repo, branch="main"):
-    """Get recent workflow runs"""
-    headers = {
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Number of artifacts fetched concurrently
+DOWNLOAD_WORKERS = 8
+
+# Artifacts smaller than this stay in memory while downloading
+SPOOL_MAX_SIZE = 64 << 20
+# Copy buffer used when streaming artifact bodies
+COPY_BUFFER_SIZE = 1 << 20
+
+# Only the start of each serial output is kept; the rest is hashed
+SERIAL_PREVIEW_CHARS = 500
+
+# Number of trailing qemu_debug.log lines kept
+QEMU_LOG_TAIL_LINES = 100
+
+# Fields kept from API listings; everything else is dropped before caching
+RUN_FIELDS = ("id", "display_title", "status", "conclusion")
+ARTIFACT_FIELDS = ("id", "name", "size_in_bytes")
+
+# ETag cache for GitHub API responses: {url: [etag, body]}
+API_CACHE_FILE = Path.home() / ".cache" / "ai-os-dev" / "gh_api.json"
+_api_cache = None
+
+def create_session(token):
+    """Create a pooled HTTP session shared by all API calls and downloads"""
+    session = requests.Session()
+    session.headers.update({
         "Authorization": f"token {token}",
         "Accept": "application/vnd.github.v3+json"
-    }
-    
-    url = f"https://api.github.com/repos/{owner}/{repo}/actions/runs"
-    params = {"branch": branch, "per_page": 5}
+    })
     
-    response = requests.get(url, headers=headers, params=params)
-    response.raise_for_status()
+    # Keep enough sockets alive for every concurrent download worker
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=2 * DOWNLOAD_WORKERS)
+    session.mount("https://", adapter)
     
-    return response.json()["workflow_runs"]
+    return session
 
-def get_run_artifacts(token, owner, repo, run_id):
-    """Get artifacts for a specific run"""
-    headers = {
-        "Authorization": f"token {token}",
-        "Accept": "application/vnd.github.v3+json"
-    }
+def load_api_cache():
+    """Load the on-disk API cache, registering a save on exit"""
+    global _api_cache
+    if _api_cache is None:
+        try:
+            with open(API_CACHE_FILE, "r") as f:
+                _api_cache = json.load(f)
+        except (OSError, ValueError):
+            _api_cache = {}
+        atexit.register(save_api_cache)
+    return _api_cache
+
+def save_api_cache():
+    """Persist the API cache"""
+    if not _api_cache:
+        return
+    try:
+        API_CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = API_CACHE_FILE.with_suffix(".tmp")
+        with open(tmp_file, "w") as f:
+            json.dump(_api_cache, f)
+        os.replace(tmp_file, API_CACHE_FILE)
+    except OSError:
+        pass
+
+def cached_get(session, url, params=None, project=None):
+    """GET a GitHub API URL, revalidating cached bodies via ETag"""
+    cache = load_api_cache()
+    key = f"{url}?{urlencode(sorted(params.items()))}" if params else url
     
-    url = f"https://api.github.com/repos/{owner}/{repo}/actions/runs/{run_id}/artifacts"
+    headers = {}
+    cached = cache.get(key)
+    if cached:
+        headers["If-None-Match"] = cached[0]
+    
+    response = session.get(url, params=params, headers=headers)
+    
+    # 304 responses don't count against the rate limit
+    if response.status_code == 304 and cached:
+        return cached[1]
     
-    response = requests.get(url, headers=headers)
     response.raise_for_status()
+    body = response.json()
+    # Trim the body before it is cached so the cache stays small
+    if project:
+        body = project(body)
+    
+    etag = response.headers.get("ETag")
+    if etag:
+        cache[key] = [etag, body]
     
-    return response.json()["artifacts"]
+    return body
 
-def download_artifact(token, owner, repo, artifact_id, output_dir):
-    """Download a specific artifact"""
-    headers = {
-        "Authorization": f"token {token}",
-        "Accept": "application/vnd.github.v3+json"
-    }
+def select_fields(items, fields):
+    """Keep only the given fields of each item in an API listing"""
+    return [{field: item.get(field) for field in fields} for item in items]
+
+def get_workflow_runs(session, owner, repo, branch="main", limit=1):
+    """Get recent workflow runs"""
+    url = f"https://api.github.com/repos/{owner}/{repo}/actions/runs"
+    params = {"branch": branch, "per_page": limit}
+    
+    return cached_get(
+        session, url, params,
+        project=lambda body: select_fields(body["workflow_runs"], RUN_FIELDS)
+    )
+
+def get_run_artifacts(session, owner, repo, run_id):
+    """Get artifacts for a specific run"""
+    url = f"https://api.github.com/repos/{owner}/{repo}/actions/runs/{run_id}/artifacts"
     
+    return cached_get(
+        session, url,
+        project=lambda body: select_fields(body["artifacts"], ARTIFACT_FIELDS)
+    )
+
+def download_artifact(session, owner, repo, artifact_id):
+    """Download a specific artifact into a spooled buffer"""
     # Get download URL
     url = f"https://api.github.com/repos/{owner}/{repo}/actions/artifacts/{artifact_id}/zip"
     
-    response = requests.get(url, headers=headers, allow_redirects=True)
-    response.raise_for_status()
-    
-    # Save zip file
-    zip_path = output_dir / f"artifact_{artifact_id}.zip"
-    with open(zip_path, "wb") as f:
-        f.write(response.content)
-    
-    # Extract
-    extract_dir = output_dir / f"artifact_{artifact_id}"
-    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-        zip_ref.extractall(extract_dir)
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    try:
+        with session.get(url, allow_redirects=True, stream=True) as response:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            shutil.copyfileobj(response.raw, spool, length=COPY_BUFFER_SIZE)
+    except Exception:
+        spool.close()
+        raise
     
-    # Remove zip
-    zip_path.unlink()
+    spool.seek(0)
+    return spool
+
+def read_log_tail(zip_ref, name, num_lines):
+    """Read the last lines of a zipped log, holding only those lines"""
+    with zip_ref.open(name) as raw:
+        with io.TextIOWrapper(raw, encoding="utf-8", errors="replace") as f:
+            return "".join(deque(f, maxlen=num_lines))
+
+def summarize_serial_output(zip_ref, info):
+    """Summarize a zipped serial dump as its preview, size and digest"""
+    digest = hashlib.blake2b()
+    with zip_ref.open(info) as f:
+        raw = f.read(SERIAL_PREVIEW_CHARS * 4)
+        digest.update(raw)
+        # Hash the remainder without keeping it
+        for chunk in iter(lambda: f.read(COPY_BUFFER_SIZE), b""):
+            digest.update(chunk)
     
-    return extract_dir
+    text = raw.decode("utf-8", errors="replace")
+    return {
+        "head": text[:SERIAL_PREVIEW_CHARS],
+        "size": info.file_size,
+        "truncated": len(text) > SERIAL_PREVIEW_CHARS or info.file_size > len(raw),
+        "blake2b": digest.hexdigest()
+    }
 
-def analyze_test_results(artifact_dir):
-    """Analyze the downloaded test results"""
+def analyze_test_results(zip_ref):
+    """Analyze the test results inside a downloaded artifact zip"""
     results = {
         "serial_outputs": {},
         "test_summary": None,
         "qemu_log": None
     }
     
-    # Look for serial output files
-    serial_dir = artifact_dir / "output"
-    if serial_dir.exists():
-        for serial_file in serial_dir.glob("serial_*.txt"):
-            with open(serial_file, "r", errors="replace") as f:
-                results["serial_outputs"][serial_file.name] = f.read()
-    
-    # Look for test report
-    report_file = artifact_dir / "test_report.md"
-    if report_file.exists():
-        with open(report_file, "r") as f:
-            results["test_summary"] = f.read()
-    
-    # Look for QEMU log
-    qemu_log = artifact_dir / "output" / "qemu_debug.log"
-    if qemu_log.exists():
-        with open(qemu_log, "r", errors="replace") as f:
-            # Just last 100 lines
-            lines = f.readlines()
-            results["qemu_log"] = "".join(lines[-100:])
+    # Only the few members we report on are inflated; nothing touches disk
+    qemu_logs = {}
+    for info in zip_ref.infolist():
+        name = info.filename
+        dirname, basename = posixpath.split(name)
+        
+        # Look for serial output files
+        if dirname == "output" and fnmatch.fnmatch(basename, "serial_*.txt"):
+            results["serial_outputs"][basename] = summarize_serial_output(zip_ref, info)
+        
+        # Look for test report
+        elif name == "test_report.md":
+            results["test_summary"] = zip_ref.read(info).decode("utf-8", errors="replace")
+        
+        # Look for QEMU logs (one per worker when tests ran under xdist)
+        elif dirname == "output" and fnmatch.fnmatch(basename, "qemu_debug*.log"):
+            qemu_logs[basename] = read_log_tail(zip_ref, info, QEMU_LOG_TAIL_LINES)
+    
+    if len(qemu_logs) == 1:
+        results["qemu_log"] = next(iter(qemu_logs.values()))
+    elif qemu_logs:
+        results["qemu_log"] = "\n".join(
+            f"==> {name} <==\n{qemu_logs[name]}" for name in sorted(qemu_logs)
+        )
     
     return results
 
+def fetch_and_analyze(session, owner, repo, artifact):
+    """Download and analyze a single artifact (runs in a worker thread)"""
+    with download_artifact(session, owner, repo, artifact['id']) as spool:
+        with zipfile.ZipFile(spool, 'r') as zip_ref:
+            return analyze_test_results(zip_ref)
+
 def main():
     parser = argparse.ArgumentParser(description="Download and analyze GitHub Actions artifacts")
     parser.add_argument("--token", required=True, help="GitHub personal access token")
@@ -113,12 +236,14 @@ def main():
     output_dir = Path(args.output)
     output_dir.mkdir(exist_ok=True)
     
+    session = create_session(args.token)
+    
     try:
         if args.run_id:
             run_id = args.run_id
         else:
             # Get latest run
-            runs = get_workflow_runs(args.token, args.owner, args.repo)
+            runs = get_workflow_runs(session, args.owner, args.repo)
             if not runs:
                 print("No workflow runs found")
                 return
@@ -128,7 +253,7 @@ def main():
             print(f"Status: {runs[0]['status']}, Conclusion: {runs[0]['conclusion']}")
         
         # Get artifacts
-        artifacts = get_run_artifacts(args.token, args.owner, args.repo, run_id)
+        artifacts = get_run_artifacts(session, args.owner, args.repo, run_id)
         
         if not artifacts:
             print("No artifacts found for this run")
@@ -138,55 +263,73 @@ def main():
         for artifact in artifacts:
             print(f"  - {artifact['name']} ({artifact['size_in_bytes']} bytes)")
         
-        # Download and analyze each artifact
+        # Download and analyze artifacts concurrently
+        print(f"\nDownloading and analyzing {len(artifacts)} artifacts...")
         all_results = {}
-        for artifact in artifacts:
-            print(f"\nDownloading {artifact['name']}...")
-            artifact_dir = download_artifact(
-                args.token, args.owner, args.repo, 
-                artifact['id'], output_dir
-            )
-            
-            print(f"Analyzing {artifact['name']}...")
-            results = analyze_test_results(artifact_dir)
-            all_results[artifact['name']] = results
+        with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as pool:
+            futures = {
+                pool.submit(
+                    fetch_and_analyze, session,
+                    args.owner, args.repo, artifact
+                ): artifact['name']
+                for artifact in artifacts
+            }
+            for future in as_completed(futures):
+                name = futures[future]
+                all_results[name] = future.result()
+                print(f"Analyzed {name}")
+        
+        # Keep report order stable regardless of completion order
+        all_results = {
+            artifact['name']: all_results[artifact['name']]
+            for artifact in artifacts
+        }
         
         # Generate summary report
-        print("\n=== ANALYSIS RESULTS ===\n")
+        report = io.StringIO()
+        print("\n=== ANALYSIS RESULTS ===\n", file=report)
         
         for artifact_name, results in all_results.items():
-            print(f"## {artifact_name}\n")
+            print(f"## {artifact_name}\n", file=report)
             
             if results["test_summary"]:
-                print("### Test Summary")
-                print(results["test_summary"])
+                print("### Test Summary", file=report)
+                print(results["test_summary"], file=report)
             
             if results["serial_outputs"]:
-                print("\n### Serial Outputs")
-                for filename, content in results["serial_outputs"].items():
-                    print(f"\n#### {filename}")
-                    print("```")
-                    print(content[:500])  # First 500 chars
-                    if len(content) > 500:
-                        print("...")
-                    print("```")
+                print("\n### Serial Outputs", file=report)
+                for filename, output in results["serial_outputs"].items():
+                    print(f"\n#### {filename}", file=report)
+                    print("```", file=report)
+                    print(output["head"], file=report)  # First 500 chars
+                    if output["truncated"]:
+                        print("...", file=report)
+                    print("```", file=report)
             
             if results["qemu_log"]:
-                print("\n### QEMU Log (last 100 lines)")
-                print("```")
-                print(results["qemu_log"])
-                print("```")
+                print(f"\n### QEMU Log (last {QEMU_LOG_TAIL_LINES} lines per log)", file=report)
+                print("```", file=report)
+                print(results["qemu_log"], file=report)
+                print("```", file=report)
+        
+        # Emit the whole report in a single write
+        sys.stdout.write(report.getvalue())
         
         # Save full results as JSON
         results_file = output_dir / "analysis_results.json"
-        with open(results_file, "w") as f:
-            json.dump(all_results, f, indent=2)
+        if orjson:
+            results_file.write_bytes(orjson.dumps(all_results, option=orjson.OPT_INDENT_2))
+        else:
+            with open(results_file, "w") as f:
+                json.dump(all_results, f, indent=2)
         
         print(f"\nFull results saved to: {results_file}")
         
     except Exception as e:
         print(f"Error: {e}")
         return 1
+    finally:
+        session.close()
     
     return 0
 
@@ -6,46 +6,55 @@ Allows AI to check workflow status and results
 
 import os
 import sys
+import re
 import json
 import subprocess
 import tempfile
 from pathlib import Path
 
-def run_command(cmd):
-    """Run a command and return output"""
+# Fixed markers the key findings look for, matched in one pass per output
+FINDINGS_PATTERN = re.compile(
+    r"(?P<boot>AI-OS Boot v0\.3)"
+    r"|(?P<cpu>CPU Information)"
+    r"|(?P<tests>All tests passed)"
+)
+# Whole lines naming the CPU vendor; separate so they can share a line with a marker
+VENDOR_PATTERN = re.compile(r"^.*Vendor:.*$", re.MULTILINE)
+
+def run_command(args):
+    """Run a command (argv list, no shell) and return output"""
     try:
-        result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
+        result = subprocess.run(args, capture_output=True, text=True)
         if result.returncode != 0:
             return None, result.stderr
         return result.stdout.strip(), None
+    except FileNotFoundError:
+        return None, f"{args[0]} not installed"
     except Exception as e:
         return None, str(e)
 
-def check_gh_cli():
-    """Check if GitHub CLI is installed and authenticated"""
-    output, error = run_command("gh --version")
-    if error:
-        return False, "GitHub CLI (gh) not installed"
-    
-    output, error = run_command("gh auth status")
-    if error:
-        return False, "GitHub CLI not authenticated. Run: gh auth login"
-    
-    return True, "GitHub CLI ready"
-
 def get_latest_run(owner="cmraible", repo="ai-os-dev"):
     """Get the latest workflow run"""
-    cmd = f"gh run list --repo {owner}/{repo} --limit 1 --json databaseId,displayTitle,status,conclusion,createdAt"
-    output, error = run_command(cmd)
+    # No separate gh preflight: a missing or unauthenticated gh
+    # surfaces through this command's own error
+    output, error = run_command([
+        "gh", "run", "list",
+        "--repo", f"{owner}/{repo}",
+        "--limit", "1",
+        "--json", "databaseId,displayTitle,status,conclusion,createdAt",
+        "--jq", ".[0]"
+    ])
     
     if error:
+        if "gh auth login" in error:
+            return None, "GitHub CLI not authenticated. Run: gh auth login"
         return None, error
     
     try:
-        runs = json.loads(output)
-        if not runs:
+        run = json.loads(output) if output else None
+        if not run:
             return None, "No workflow runs found"
-        return runs[0], None
+        return run, None
     except json.JSONDecodeError:
         return None, "Failed to parse workflow runs"
 
@@ -56,8 +65,11 @@ def download_artifacts(owner, repo, run_id, output_dir):
     temp_dir.mkdir(parents=True, exist_ok=True)
     
     # Download artifacts
-    cmd = f"gh run download {run_id} --repo {owner}/{repo} --dir {temp_dir}"
-    output, error = run_command(cmd)
+    output, error = run_command([
+        "gh", "run", "download", str(run_id),
+        "--repo", f"{owner}/{repo}",
+        "--dir", str(temp_dir)
+    ])
     
     if error:
         return None, error
@@ -129,39 +141,36 @@ def print_report(run_info, report):
     # Look for specific test results
     print("\n=== KEY FINDINGS ===")
     
+    # Scan each output once for all markers
+    findings = {}
+    for filename in ("serial_boot.txt", "serial_cpu.txt", "serial_test.txt"):
+        content = report["serial_outputs"].get(filename, "")
+        found = {match.lastgroup: True for match in FINDINGS_PATTERN.finditer(content)}
+        found["vendors"] = [line.strip() for line in VENDOR_PATTERN.findall(content)]
+        findings[filename] = found
+    
     # Check boot message
-    boot_output = report["serial_outputs"].get("serial_boot.txt", "")
-    if "AI-OS Boot v0.3" in boot_output:
+    if findings["serial_boot.txt"].get("boot"):
         print("✓ Bootloader v0.3 booted successfully")
     else:
         print("✗ Bootloader boot issue")
     
     # Check CPU info
-    cpu_output = report["serial_outputs"].get("serial_cpu.txt", "")
-    if "CPU Information" in cpu_output:
+    cpu_findings = findings["serial_cpu.txt"]
+    if cpu_findings.get("cpu"):
         print("✓ CPU info command working")
-        if "Vendor:" in cpu_output:
-            # Extract vendor
-            for line in cpu_output.split('\n'):
-                if "Vendor:" in line:
-                    print(f"  - {line.strip()}")
+        for vendor in cpu_findings["vendors"]:
+            print(f"  - {vendor}")
     else:
         print("✗ CPU info command issue")
     
     # Check tests
-    test_output = report["serial_outputs"].get("serial_test.txt", "")
-    if "All tests passed" in test_output:
+    if findings["serial_test.txt"].get("tests"):
         print("✓ All self-tests passed")
     else:
         print("✗ Self-tests failed")
 
 def main():
-    # Check prerequisites
-    ok, message = check_gh_cli()
-    if not ok:
-        print(f"Error: {message}")
-        return 1
-    
     # Get latest run
     run_info, error = get_latest_run()
     if error:
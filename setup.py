@@ -9,11 +9,18 @@ import sys
 import subprocess
 import json
 import time
+import base64
+import hashlib
+import atexit
+import shutil
+import socket
+import tempfile
 import threading
 import queue
 from flask import Flask, request, jsonify
 import serial
 import struct
+from pathlib import Path
 
 app = Flask(__name__)
 
@@ -22,90 +29,218 @@ qemu_process = None
 serial_port = None
 output_queue = queue.Queue()
 boot_image_path = "boot.bin"
+# Build in RAM-backed tmpfs where available (falls back on e.g. macOS)
+build_dir = Path('/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()) / f'aios_{os.getpid()}'
+atexit.register(shutil.rmtree, build_dir, ignore_errors=True)
+# Compiled images keyed by SHA-256 of their source, shared across runs
+compile_cache_dir = Path.home() / '.cache' / 'ai-os-dev' / 'nasm'
+# Longest batched serial read a client may ask for, in seconds
+MAX_SERIAL_WAIT = 5
+# Serial reads hold the lock for at most this long at a time, so other
+# handlers get a turn during long polls
+SERIAL_READ_SLICE = 0.1
 
 class QEMUManager:
     def __init__(self):
         self.process = None
         self.serial = None
         self.monitor = None
+        # Serial and monitor are Unix sockets, unique per instance, so an
+        # old and a new QEMU never conflict
+        self.instance = 0
+        self.socket_paths = ()
+        # Serializes serial access now that requests are served concurrently
+        self.serial_lock = threading.RLock()
+        self.compile_cache = {}  # sha256 of source -> compiled image
         
     def compile_bootloader(self, asm_code):
         """Compile assembly code to binary bootloader"""
+        build_dir.mkdir(exist_ok=True)
+        key = hashlib.sha256(asm_code.encode()).hexdigest()
+        
+        # One file per source, so a build never rewrites the image a running
+        # QEMU booted from
+        asm_path = build_dir / f'boot_{key[:16]}.asm'
+        bin_path = build_dir / f'boot_{key[:16]}.bin'
+        
+        # Skip NASM entirely if this exact source was built before
+        cache_file = compile_cache_dir / key
+        image = self.compile_cache.get(key)
+        if image is None and cache_file.exists():
+            image = cache_file.read_bytes()
+            self.compile_cache[key] = image
+        if image is not None:
+            if not bin_path.exists():
+                bin_path.write_bytes(image)
+            self._set_boot_image(bin_path)
+            return True, "Compilation successful (cached)", str(bin_path)
+        
         # Write assembly code
-        with open('boot.asm', 'w') as f:
-            f.write(asm_code)
+        asm_path.write_text(asm_code)
         
         # Compile with NASM
         try:
-            subprocess.run(['nasm', '-f', 'bin', 'boot.asm', '-o', 'boot.bin'], 
+            subprocess.run(['nasm', '-f', 'bin', str(asm_path), '-o', str(bin_path)], 
                          check=True, capture_output=True, text=True)
-            return True, "Compilation successful"
+            self._set_boot_image(bin_path)
+            
+            image = bin_path.read_bytes()
+            self.compile_cache[key] = image
+            try:
+                compile_cache_dir.mkdir(parents=True, exist_ok=True)
+                cache_file.write_bytes(image)
+            except OSError:
+                pass  # The on-disk cache is best effort
+            return True, "Compilation successful", str(bin_path)
         except subprocess.CalledProcessError as e:
-            return False, f"Compilation failed: {e.stderr}"
+            return False, f"Compilation failed: {e.stderr}", None
     
-    def start_qemu(self):
-        """Start QEMU with our bootloader"""
-        if self.process:
-            self.stop_qemu()
+    def _set_boot_image(self, path):
+        """Make path the image later resets boot"""
+        global boot_image_path
+        with self.serial_lock:
+            boot_image_path = str(path)
+    
+    def start_qemu(self, image=None, timeout=5):
+        """Start QEMU with our bootloader (the latest build unless image is given)"""
+        # Concurrent starts each get their own instance number and image
+        with self.serial_lock:
+            self.instance += 1
+            instance = self.instance
+            if image is None:
+                image = boot_image_path
+        
+        # The new instance boots while any running one keeps serving serial
+        # reads; the old instance is only torn down once the new one is ready
+        serial_path = f"/tmp/aios_serial_{os.getpid()}_{instance}.sock"
+        monitor_path = f"/tmp/aios_monitor_{os.getpid()}_{instance}.sock"
+        # Own log while both instances run; it becomes qemu.log on the swap
+        log_path = f"qemu.log.{instance}"
         
         cmd = [
             'qemu-system-x86_64',
-            '-drive', f'format=raw,file={boot_image_path}',
+            # Locking off: the old and new instance may briefly share an image
+            '-drive', f'format=raw,file={image},file.locking=off',
             '-m', '128',  # 128MB RAM
-            '-serial', 'tcp::5555,server,nowait',  # Serial on TCP port
-            '-monitor', 'tcp::5556,server,nowait',  # Monitor on TCP port
+            '-chardev', f'socket,id=serial0,path={serial_path},server=on,wait=off',
+            '-serial', 'chardev:serial0',  # Serial on Unix socket
+            '-monitor', f'unix:{monitor_path},server=on,wait=off',  # Monitor on Unix socket
             '-display', 'none',  # Headless
             '-no-reboot',  # Don't reboot on triple fault
             '-d', 'int,cpu_reset',  # Debug interrupts and resets
-            '-D', 'qemu.log'  # Log to file
+            '-D', log_path  # Log to file
         ]
         
-        self.process = subprocess.Popen(cmd)
-        time.sleep(1)  # Give QEMU time to start
+        process = subprocess.Popen(cmd)
         
-        # Connect to serial
-        try:
-            import socket
-            self.serial = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.serial.connect(('localhost', 5555))
-            self.serial.settimeout(0.1)
-        except:
+        # Connect to serial as soon as QEMU listens
+        sock = None
+        deadline = time.monotonic() + timeout
+        delay = 0.005
+        while time.monotonic() < deadline and process.poll() is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(serial_path)
+                break
+            except OSError:
+                sock.close()
+                sock = None
+            time.sleep(delay)
+            delay = min(delay * 1.5, 0.05)
+        
+        if not sock:
+            process.terminate()
+            process.wait()
+            self._remove_sockets(serial_path, monitor_path)
             return False, "Failed to connect to serial port"
+        sock.settimeout(0.1)
+        
+        # Swap in the new instance
+        with self.serial_lock:
+            self.stop_qemu()
+            self.process = process
+            self.serial = sock
+            self.socket_paths = (serial_path, monitor_path)
+            # QEMU keeps writing to the renamed file
+            if os.path.exists(log_path):
+                os.replace(log_path, 'qemu.log')
         
         return True, "QEMU started successfully"
     
     def stop_qemu(self):
         """Stop QEMU"""
-        if self.process:
-            self.process.terminate()
-            self.process.wait()
-            self.process = None
-        if self.serial:
-            self.serial.close()
-            self.serial = None
+        with self.serial_lock:
+            if self.process:
+                self.process.terminate()
+                self.process.wait()
+                self.process = None
+            if self.serial:
+                self.serial.close()
+                self.serial = None
+            self._remove_sockets(*self.socket_paths)
+            self.socket_paths = ()
+    
+    def _remove_sockets(self, *paths):
+        """Remove chardev socket files left behind by QEMU"""
+        for path in paths:
+            if os.path.exists(path):
+                os.unlink(path)
     
     def send_serial(self, data):
         """Send data to serial port"""
-        if self.serial:
-            if isinstance(data, str):
-                data = data.encode()
-            self.serial.send(data)
-            return True
-        return False
+        with self.serial_lock:
+            if self.serial:
+                if isinstance(data, str):
+                    data = data.encode()
+                self.serial.sendall(data)
+                return True
+            return False
+    
+    def _recv_slice(self, deadline):
+        """Receive one chunk, holding the serial lock for at most one read slice"""
+        # b'' when nothing arrived yet, None once there is nothing to read from
+        with self.serial_lock:
+            if not self.serial:
+                return None
+            try:
+                self.serial.settimeout(max(min(deadline - time.monotonic(), SERIAL_READ_SLICE), 0.001))
+                return self.serial.recv(4096) or None
+            except socket.timeout:
+                return b''
+            except OSError:
+                return None
     
     def read_serial(self, timeout=0.1):
         """Read from serial port"""
-        if not self.serial:
-            return b''
-        
-        try:
-            self.serial.settimeout(timeout)
-            data = self.serial.recv(4096)
-            return data
-        except socket.timeout:
-            return b''
-        except:
-            return b''
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            data = self._recv_slice(deadline)
+            if data is None:
+                break
+            if data:
+                return data
+            time.sleep(0)  # Let a handler waiting on the lock take it
+        return b''
+    
+    def read_serial_batch(self, wait):
+        """Read everything arriving on the serial port within wait seconds"""
+        chunks = []
+        deadline = time.monotonic() + min(wait, MAX_SERIAL_WAIT)
+        while time.monotonic() < deadline:
+            data = self._recv_slice(deadline)
+            if data is None:
+                break
+            chunks.append(data)
+            time.sleep(0)  # Let a handler waiting on the lock take it
+        return b''.join(chunks)
+    
+    def send_and_read(self, data, wait):
+        """Send data and read the response without interleaving other clients"""
+        # Holds the lock for the whole (capped) wait so no other read takes the reply
+        with self.serial_lock:
+            if not self.send_serial(data):
+                return None
+            return self.read_serial_batch(wait)
     
     def read_memory(self, address, size):
         """Read memory via QEMU monitor"""
@@ -116,24 +251,36 @@ class QEMUManager:
 qemu = QEMUManager()
 
 # Flask API endpoints
+def request_payload():
+    """Serial payload of a request: base64 'b64' for raw bytes, else text 'data'"""
+    if 'b64' in request.json:
+        return base64.b64decode(request.json['b64'])
+    data = request.json.get('data', '')
+    # Lists of byte values predate 'b64'; still accepted while clients move over
+    if isinstance(data, list):
+        return bytes(data)
+    return data
+
 @app.route('/compile', methods=['POST'])
 def compile():
     """Compile assembly code"""
     code = request.json.get('code', '')
-    success, message = qemu.compile_bootloader(code)
+    success, message, _ = qemu.compile_bootloader(code)
     return jsonify({'success': success, 'message': message})
 
 @app.route('/flash', methods=['POST'])
 def flash():
     """Flash bootloader and restart QEMU"""
-    # If code provided, compile first
+    # If code provided, compile first (the running QEMU keeps serving
+    # serial requests on other threads meanwhile)
+    image = None
     if 'code' in request.json:
-        success, message = qemu.compile_bootloader(request.json['code'])
+        success, message, image = qemu.compile_bootloader(request.json['code'])
         if not success:
             return jsonify({'success': False, 'message': message})
     
-    # Restart QEMU with new image
-    success, message = qemu.start_qemu()
+    # Restart QEMU with new image (this request's own build, if it made one)
+    success, message = qemu.start_qemu(image)
     return jsonify({'success': success, 'message': message})
 
 @app.route('/reset', methods=['POST'])
@@ -146,27 +293,43 @@ def reset():
 @app.route('/serial', methods=['POST'])
 def send_serial():
     """Send data to serial port"""
-    data = request.json.get('data', '')
-    if isinstance(data, list):
-        # Handle byte array
-        data = bytes(data)
+    data = request_payload()
     success = qemu.send_serial(data)
     return jsonify({'success': success})
 
 @app.route('/serial', methods=['GET'])
 def read_serial():
     """Read from serial port"""
-    data = qemu.read_serial(timeout=0.5)
+    wait_ms = request.args.get('wait_ms', type=int)
+    if wait_ms is not None:
+        # Drain everything that arrives within the window in one request
+        data = qemu.read_serial_batch(wait_ms / 1000)
+    else:
+        data = qemu.read_serial(timeout=0.5)
     return jsonify({
-        'data': list(data),  # Return as byte array
+        'b64': base64.b64encode(data).decode('ascii'),  # Raw bytes
         'text': data.decode('utf-8', errors='replace')
     })
 
+@app.route('/send_and_read', methods=['POST'])
+def send_and_read():
+    """Send data to serial port and read the response"""
+    data = request_payload()
+    wait_ms = request.json.get('wait_ms', 100)
+    response = qemu.send_and_read(data, wait_ms / 1000)
+    if response is None:
+        return jsonify({'success': False})
+    return jsonify({
+        'success': True,
+        'b64': base64.b64encode(response).decode('ascii'),  # Raw bytes
+        'text': response.decode('utf-8', errors='replace')
+    })
+
 @app.route('/memory/<int:address>/<int:size>', methods=['GET'])
 def read_memory(address, size):
     """Read memory at address"""
     data = qemu.read_memory(address, size)
-    return jsonify({'data': list(data)})
+    return jsonify({'b64': base64.b64encode(data).decode('ascii')})
 
 @app.route('/status', methods=['GET'])
 def status():
@@ -184,8 +347,9 @@ if __name__ == '__main__':
     print("  POST /flash   - Flash and boot")
     print("  POST /reset   - Reset system")
     print("  POST /serial  - Send serial data")
-    print("  GET  /serial  - Read serial data")
+    print("  GET  /serial  - Read serial data (?wait_ms=N to batch)")
+    print("  POST /send_and_read - Send serial data and read response")
     print("  GET  /memory/<addr>/<size> - Read memory")
     print("  GET  /status  - System status")
     
-    app.run(host='0.0.0.0', port=5000, debug=False)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=5000, debug=False, threaded=True)
\ No newline at end of file
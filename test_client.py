@@ -4,7 +4,6 @@ Test client for AI OS development environment
 """
 
 import requests
-import time
 import sys
 
 API_URL = "http://localhost:5000"
@@ -26,25 +25,19 @@ def test_basic_boot():
     r = requests.post(f"{API_URL}/flash", json={})
     print(f"Flash: {r.json()}")
     
-    time.sleep(1)
-    
     # Read boot message
     print("Reading serial output...")
-    r = requests.get(f"{API_URL}/serial")
+    r = requests.get(f"{API_URL}/serial", params={'wait_ms': 1000})
     print(f"Boot message: {r.json()['text']}")
     
     # Test ping command
     print("Sending ping...")
-    r = requests.post(f"{API_URL}/serial", json={'data': 'p'})
-    time.sleep(0.1)
-    r = requests.get(f"{API_URL}/serial")
+    r = requests.post(f"{API_URL}/send_and_read", json={'data': 'p'})
     print(f"Response: {r.json()['text']}")
     
     # Test info command
     print("Sending info request...")
-    r = requests.post(f"{API_URL}/serial", json={'data': 'i'})
-    time.sleep(0.1)
-    r = requests.get(f"{API_URL}/serial")
+    r = requests.post(f"{API_URL}/send_and_read", json={'data': 'i'})
     print(f"Response: {r.json()['text']}")
 
 if __name__ == '__main__':
@@ -2,13 +2,31 @@
 
 import pytest
 import os
+import errno
+import shutil
 import subprocess
 import time
 import socket
+import selectors
 import threading
-import queue
 from pathlib import Path
 
+BOOT_DIR = Path(__file__).resolve().parent.parent / "src" / "boot"
+
+# Accelerators in order of preference: QEMU itself falls back to TCG when
+# /dev/kvm is usable but KVM still fails (e.g. no nested virtualization)
+QEMU_ACCELS = ["kvm", "tcg"] if os.access("/dev/kvm", os.R_OK | os.W_OK) else ["tcg"]
+
+# Internal snapshot, taken at the ready prompt, that booted runners resume from
+READY_SNAPSHOT = "ready"
+
+# Set by pytest-xdist in each worker process; None in a plain run
+XDIST_WORKER = os.environ.get("PYTEST_XDIST_WORKER")
+
+def pytest_report_header(config):
+    """Show which QEMU accelerators the run tries"""
+    return f"qemu accelerators: {', falling back to '.join(QEMU_ACCELS)}"
+
 @pytest.fixture(scope="session")
 def output_dir():
     """Create output directory for test artifacts"""
@@ -16,115 +34,364 @@ def output_dir():
     output.mkdir(exist_ok=True)
     return output
 
-@pytest.fixture
-def qemu_runner(output_dir):
-    """Fixture to run QEMU with a given boot image"""
-    class QEMURunner:
-        def __init__(self):
-            self.process = None
-            self.serial = None
-            self.output_queue = queue.Queue()
-            self.reader_thread = None
-            
-        def start(self, boot_image, timeout=5):
-            """Start QEMU with the given boot image"""
-            if self.process:
-                self.stop()
-            
-            # Start QEMU
-            cmd = [
-                'qemu-system-x86_64',
-                '-drive', f'format=raw,file={boot_image}',
-                '-m', '128',
-                '-serial', 'tcp::5555,server,nowait',
-                '-display', 'none',
-                '-no-reboot',
-                '-d', 'cpu_reset,int',
-                '-D', str(output_dir / 'qemu_debug.log')
-            ]
-            
-            self.process = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE
-            )
-            
-            # Give QEMU time to start
-            time.sleep(0.5)
-            
-            # Connect to serial port
-            start_time = time.time()
-            while time.time() - start_time < timeout:
-                try:
-                    self.serial = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                    self.serial.connect(('localhost', 5555))
-                    self.serial.settimeout(0.1)
-                    break
-                except:
-                    time.sleep(0.1)
-            
-            if not self.serial:
-                raise RuntimeError("Failed to connect to QEMU serial port")
-            
-            # Start reader thread
-            self.reader_thread = threading.Thread(target=self._reader)
-            self.reader_thread.daemon = True
-            self.reader_thread.start()
-            
-            return self
+@pytest.fixture(scope="session")
+def boot_image():
+    """Main bootloader image, resolved independently of the working directory"""
+    image = BOOT_DIR / "boot.bin"
+    assert image.exists(), "Boot image not found - run make first"
+    return image
+
+@pytest.fixture(scope="session")
+def test_boot_image():
+    """Echo test bootloader image"""
+    image = BOOT_DIR / "test_boot.bin"
+    assert image.exists(), "Test boot image not found"
+    return image
+
+class QEMURunner:
+    """QEMU instance driven over its serial port"""
+    
+    def __init__(self, output_dir, log_name="qemu_debug"):
+        self.output_dir = output_dir
+        self.process = None
+        self.serial = None
+        self.selector = None
+        self.buffer = bytearray()
+        self.socket_path = None
+        self.monitor_path = None
+        self.booting = None  # Background boot thread, see start(ready=...)
+        self.boot_error = None
+        self.boot_lines = []
+        # Parallel workers each get their own log instead of clobbering one
+        self.debug_log_name = f"{log_name}_{XDIST_WORKER}.log" if XDIST_WORKER else f"{log_name}.log"
         
-        def _reader(self):
-            """Background thread to read serial output"""
-            buffer = b''
-            while self.serial:
-                try:
-                    data = self.serial.recv(1024)
-                    if data:
-                        buffer += data
-                        # Look for complete lines
-                        while b'\n' in buffer:
-                            line, buffer = buffer.split(b'\n', 1)
-                            self.output_queue.put(line.strip())
-                except socket.timeout:
-                    pass
-                except:
-                    break
+    def start(self, boot_image, timeout=5, loadvm=None, monitor=False, ready=None, ready_timeout=2):
+        """Start QEMU with the given boot image"""
+        if self.process:
+            self.stop()
         
-        def send(self, data):
-            """Send data to serial port"""
-            if isinstance(data, str):
-                data = data.encode()
-            self.serial.send(data)
+        # Unix socket chardev: no TCP port to collide on between runs; pid and
+        # runner id keep xdist workers and coexisting runners apart
+        self.socket_path = f"/tmp/aios_{os.getpid()}_{id(self)}.sock"
+        self.monitor_path = f"/tmp/aios_{os.getpid()}_{id(self)}.mon" if monitor else None
+        for path in (self.socket_path, self.monitor_path):
+            if path and os.path.exists(path):
+                os.unlink(path)
         
-        def read_line(self, timeout=2):
-            """Read a line from serial output"""
-            try:
-                return self.output_queue.get(timeout=timeout)
-            except queue.Empty:
-                return None
+        # qcow2 images can carry the snapshot passed as loadvm; raw images are
+        # shared, so guest writes go to a throwaway overlay and runners can
+        # boot the same one at once
+        if str(boot_image).endswith('.qcow2'):
+            drive = f'format=qcow2,file={boot_image}'
+        else:
+            drive = f'format=raw,file={boot_image},snapshot=on'
+        
+        # Start QEMU
+        cmd = [
+            'qemu-system-x86_64',
+            '-drive', drive,
+            '-m', '128',
+            *(arg for accel in QEMU_ACCELS for arg in ('-accel', accel)),
+            '-machine', 'acpi=off',  # Nothing here uses ACPI; skip its setup
+            '-monitor', f'unix:{self.monitor_path},server=on,wait=off' if monitor else 'none',
+            # No NIC or VGA, so SeaBIOS skips the iPXE and VGA option ROMs
+            '-nic', 'none',
+            '-vga', 'none',
+            '-chardev', f'socket,id=serial0,path={self.socket_path},server=on,wait=off',
+            '-serial', 'chardev:serial0',
+            '-display', 'none',
+            '-no-reboot',
+            '-d', 'cpu_reset,int',
+            '-D', str(self.output_dir / self.debug_log_name)
+        ]
+        if loadvm:
+            cmd += ['-loadvm', loadvm]
         
-        def read_until(self, expected, timeout=5):
-            """Read until expected string is found"""
-            start_time = time.time()
-            lines = []
-            while time.time() - start_time < timeout:
-                line = self.read_line(timeout=0.1)
-                if line:
-                    lines.append(line)
-                    if expected.encode() in line:
-                        return lines
-            return lines
+        self.process = subprocess.Popen(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE
+        )
+        
+        self.buffer.clear()
+        self.boot_error = None
+        self.boot_lines = []
+        if ready:
+            # Return right away and let the boot overlap other work; the
+            # first send or read waits for the ready message
+            self.booting = threading.Thread(
+                target=self._boot, args=(timeout, ready, ready_timeout), daemon=True
+            )
+            self.booting.start()
+        else:
+            self._open_serial(timeout)
         
-        def stop(self):
-            """Stop QEMU"""
-            if self.serial:
-                self.serial.close()
-                self.serial = None
-            if self.process:
-                self.process.terminate()
-                self.process.wait(timeout=5)
-                self.process = None
-    
-    runner = QEMURunner()
+        return self
+    
+    def _open_serial(self, timeout):
+        """Connect to the serial port as soon as QEMU starts listening"""
+        self.serial = self._connect(self.socket_path, timeout)
+        if not self.serial:
+            raise RuntimeError("Failed to connect to QEMU serial port")
+        
+        # Poll the socket directly instead of running a reader thread
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.serial, selectors.EVENT_READ)
+    
+    def _boot(self, timeout, ready, ready_timeout):
+        """Connect and read up to the ready message (runs in the boot thread)"""
+        try:
+            self._open_serial(timeout)
+            self.boot_lines = self._read_until(ready, ready_timeout)
+            if not self.boot_lines or ready.encode() not in self.boot_lines[-1]:
+                raise RuntimeError(f"QEMU did not print {ready!r} within {ready_timeout}s")
+        except Exception as e:
+            self.boot_error = e
+    
+    def wait_ready(self):
+        """Wait for a background boot to finish and return the lines it read"""
+        if self.booting:
+            self.booting.join()
+            self.booting = None
+        # A failed boot fails every later use of the runner, not just the first
+        if self.boot_error:
+            raise self.boot_error
+        return self.boot_lines
+    
+    def _connect(self, address, timeout):
+        """Connect to the serial chardev, retrying with backoff until it listens"""
+        deadline = time.monotonic() + timeout
+        delay = 0.005
+        while time.monotonic() < deadline:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(address)
+                return sock
+            except OSError as e:
+                sock.close()
+                if e.errno not in (errno.ECONNREFUSED, errno.ENOENT):
+                    raise
+                if self.process.poll() is not None:
+                    raise RuntimeError(f"QEMU exited with code {self.process.returncode}")
+            time.sleep(delay)
+            delay = min(delay * 1.5, 0.05)
+        return None
+    
+    def _fill(self, timeout):
+        """Wait up to timeout for serial data and append it to the buffer"""
+        if not self.selector.select(max(timeout, 0)):
+            return False
+        data = self.serial.recv(65536)
+        if not data:
+            raise EOFError("QEMU closed the serial connection")
+        self.buffer += data
+        return True
+    
+    def send(self, data):
+        """Send data to serial port"""
+        self.wait_ready()
+        if isinstance(data, str):
+            data = data.encode()
+        self.serial.sendall(data)
+    
+    def read_line(self, timeout=2):
+        """Read a line from serial output"""
+        self.wait_ready()
+        deadline = time.monotonic() + timeout
+        while True:
+            index = self.buffer.find(b'\n')
+            if index >= 0:
+                line = bytes(self.buffer[:index])
+                del self.buffer[:index + 1]
+                return line.strip()
+            try:
+                if not self._fill(deadline - time.monotonic()):
+                    return None
+            except EOFError:
+                return None
+    
+    def read_lines(self, count, timeout=2):
+        """Read up to count non-empty lines within a single timeout"""
+        deadline = time.monotonic() + timeout
+        lines = []
+        while len(lines) < count:
+            line = self.read_line(timeout=deadline - time.monotonic())
+            if line is None:
+                break
+            if line:
+                lines.append(line)
+        return lines
+    
+    def read_lines_until_idle(self, idle=0.2, timeout=1):
+        """Read lines until the output goes quiet for idle seconds (or timeout)"""
+        self.wait_ready()
+        deadline = time.monotonic() + timeout
+        try:
+            # Wait up to timeout for the response to start; only the gaps
+            # after that are cut off at idle
+            if self.buffer or self._fill(deadline - time.monotonic()):
+                while self._fill(min(idle, deadline - time.monotonic())):
+                    pass
+        except EOFError:
+            pass
+        return self._take_lines(self.buffer.rfind(b'\n') + 1)
+    
+    def read_bytes(self, count, timeout=2):
+        """Read up to count raw bytes within a single timeout"""
+        self.wait_ready()
+        deadline = time.monotonic() + timeout
+        try:
+            while len(self.buffer) < count and self._fill(deadline - time.monotonic()):
+                pass
+        except EOFError:
+            pass
+        data = bytes(self.buffer[:count])
+        del self.buffer[:count]
+        return data
+    
+    def read_until(self, expected, timeout=5):
+        """Read until expected string is found"""
+        self.wait_ready()
+        return self._read_until(expected, timeout)
+    
+    def _read_until(self, expected, timeout):
+        """read_until without waiting on a background boot"""
+        if isinstance(expected, str):
+            expected = expected.encode()
+        deadline = time.monotonic() + timeout
+        start = 0
+        while True:
+            # Scan the raw buffer once per recv rather than line by line
+            index = self.buffer.find(expected, start)
+            if index >= 0:
+                end = self.buffer.find(b'\n', index + len(expected))
+                if end >= 0:
+                    return self._take_lines(end + 1)
+            else:
+                start = max(0, len(self.buffer) - len(expected) + 1)
+            try:
+                if not self._fill(deadline - time.monotonic()):
+                    break
+            except EOFError:
+                break
+        # Timed out: hand back the complete lines seen so far
+        return self._take_lines(self.buffer.rfind(b'\n') + 1)
+    
+    def _take_lines(self, end):
+        """Consume buffer[:end] and return its non-empty stripped lines"""
+        chunk = bytes(self.buffer[:end])
+        del self.buffer[:end]
+        return [line.strip() for line in chunk.split(b'\n') if line.strip()]
+    
+    def drain(self, idle=0.01):
+        """Discard serial output until the line has been quiet for idle seconds"""
+        self.wait_ready()
+        self.buffer.clear()
+        try:
+            while self._fill(idle):
+                self.buffer.clear()
+        except EOFError:
+            pass
+    
+    def monitor_command(self, command, timeout=10):
+        """Run an HMP command on the QEMU monitor and return its output"""
+        sock = self._connect(self.monitor_path, timeout)
+        if not sock:
+            raise RuntimeError("Failed to connect to QEMU monitor")
+        with sock:
+            sock.settimeout(timeout)
+            prompt = b"(qemu) "
+            
+            def read_prompt():
+                data = b""
+                while not data.endswith(prompt):
+                    chunk = sock.recv(4096)
+                    if not chunk:
+                        raise EOFError("QEMU closed the monitor connection")
+                    data += chunk
+                return data[:-len(prompt)]
+            
+            read_prompt()  # Greeting
+            sock.sendall(command.encode() + b"\n")
+            return read_prompt().decode(errors="replace")
+    
+    def stop(self):
+        """Stop QEMU"""
+        if self.booting:
+            # Let the boot thread finish its bounded read before closing under it
+            self.booting.join()
+            self.booting = None
+        if self.selector:
+            self.selector.close()
+            self.selector = None
+        if self.serial:
+            self.serial.close()
+            self.serial = None
+        if self.process:
+            self.process.terminate()
+            self.process.wait(timeout=5)
+            self.process = None
+        for path in (self.socket_path, self.monitor_path):
+            if path and os.path.exists(path):
+                os.unlink(path)
+
+@pytest.fixture
+def qemu_runner(output_dir):
+    """Fixture to run QEMU with a given boot image"""
+    runner = QEMURunner(output_dir)
     yield runner
-    runner.stop()
\ No newline at end of file
+    runner.stop()
+
+@pytest.fixture(scope="session")
+def ready_snapshot(tmp_path_factory, output_dir, boot_image):
+    """qcow2 copy of boot.bin holding a VM snapshot taken at the ready prompt"""
+    # None when the snapshot can't be taken; runners then cold-boot instead
+    if not shutil.which("qemu-img"):
+        return None
+    
+    image = tmp_path_factory.mktemp("snapshot") / "ready.qcow2"
+    result = subprocess.run(
+        ["qemu-img", "convert", "-f", "raw", "-O", "qcow2", str(boot_image), str(image)],
+        capture_output=True
+    )
+    if result.returncode != 0:
+        return None
+    
+    runner = QEMURunner(output_dir)
+    try:
+        runner.start(image, monitor=True)
+        lines = runner.read_until("Ready for commands", timeout=2)
+        if not lines or b"Ready for commands" not in lines[-1]:
+            return None
+        output = runner.monitor_command(f"savevm {READY_SNAPSHOT}")
+        if "Error" in output:
+            return None
+    except (OSError, EOFError, RuntimeError):
+        return None
+    finally:
+        runner.stop()
+    
+    return image
+
+@pytest.fixture(scope="class")
+def booted_runner(tmp_path_factory, output_dir, boot_image, ready_snapshot):
+    """QEMU booted once into boot.bin and shared by a whole test class"""
+    # Own debug log, as it runs alongside the class's qemu_runner tests
+    runner = QEMURunner(output_dir, log_name="qemu_debug_shared")
+    if ready_snapshot:
+        # Resume at the prompt from a private copy of the snapshot image
+        image = tmp_path_factory.mktemp("vm") / "ready.qcow2"
+        shutil.copy(ready_snapshot, image)
+        runner.start(image, loadvm=READY_SNAPSHOT)
+    else:
+        # Boots in the background while the class's first tests run; the
+        # first ready_runner use waits for it
+        runner.start(boot_image, ready="Ready for commands")
+    yield runner
+    runner.stop()
+
+@pytest.fixture
+def ready_runner(booted_runner):
+    """Shared booted QEMU with stale serial output discarded"""
+    booted_runner.drain()
+    return booted_runner
\ No newline at end of file
@@ -28,10 +28,10 @@ def generate_report():
                 print("[Error reading file]")
             print("```\n")
     
-    # Check for QEMU debug log
-    qemu_log = output_dir / "qemu_debug.log"
-    if qemu_log.exists():
-        print("## QEMU Debug Log\n")
+    # Check for QEMU debug logs (one per worker when run under xdist)
+    qemu_logs = sorted(output_dir.glob("qemu_debug*.log"))
+    for qemu_log in qemu_logs:
+        print(f"## QEMU Debug Log ({qemu_log.name})\n")
         print("```")
         try:
             content = qemu_log.read_text(errors='replace')
@@ -46,7 +46,7 @@ def generate_report():
     # Summary
     print("## Summary\n")
     print(f"- Serial outputs captured: {len(serial_files)}")
-    print(f"- QEMU log available: {qemu_log.exists()}")
+    print(f"- QEMU log available: {bool(qemu_logs)}")
     print("\n---")
     print("*Generated by automated test system*")
 
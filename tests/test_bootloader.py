@@ -2,16 +2,14 @@
 
 import pytest
 import time
-from pathlib import Path
 
+# Start the shared VM with the class so its boot overlaps test_boot_message
+@pytest.mark.usefixtures("booted_runner")
 class TestBootloader:
     """Basic bootloader functionality tests"""
     
-    def test_boot_message(self, qemu_runner, output_dir):
+    def test_boot_message(self, qemu_runner, output_dir, boot_image):
         """Test that bootloader sends initial message"""
-        boot_image = Path("../src/boot/boot.bin")
-        assert boot_image.exists(), "Boot image not found - run make first"
-        
         # Start QEMU
         qemu_runner.start(boot_image)
         
@@ -20,26 +18,20 @@ class TestBootloader:
         
         # Save output
         with open(output_dir / "serial_boot.txt", "wb") as f:
-            for line in lines:
-                f.write(line + b"\n")
+            f.write(b"\n".join(lines + [b""]))
         
         # Verify boot message
-        assert any(b"AI-OS Boot" in line for line in lines), "Boot message not found"
-        assert any(b"Ready for commands" in line for line in lines), "Ready message not found"
+        output = b"\n".join(lines)
+        assert b"AI-OS Boot" in output, "Boot message not found"
+        assert b"Ready for commands" in output, "Ready message not found"
     
-    def test_ping_command(self, qemu_runner, output_dir):
+    def test_ping_command(self, ready_runner, output_dir):
         """Test ping command"""
-        boot_image = Path("../src/boot/boot.bin")
-        qemu_runner.start(boot_image)
-        
-        # Wait for boot
-        qemu_runner.read_until("Ready for commands", timeout=2)
-        
         # Send ping
-        qemu_runner.send('p')
+        ready_runner.send('p')
         
         # Read response
-        response = qemu_runner.read_line(timeout=1)
+        response = ready_runner.read_line(timeout=1)
         
         # Save output
         with open(output_dir / "serial_ping.txt", "wb") as f:
@@ -47,153 +39,99 @@ class TestBootloader:
         
         assert response == b"PONG", f"Expected PONG, got {response}"
     
-    def test_info_command(self, qemu_runner, output_dir):
+    def test_info_command(self, ready_runner, output_dir):
         """Test info command"""
-        boot_image = Path("../src/boot/boot.bin")
-        qemu_runner.start(boot_image)
-        
-        # Wait for boot
-        qemu_runner.read_until("Ready for commands", timeout=2)
-        
         # Send info command
-        qemu_runner.send('i')
+        ready_runner.send('i')
         
         # Read response
-        lines = []
-        for _ in range(3):  # Expect 3 lines
-            line = qemu_runner.read_line(timeout=1)
-            if line:
-                lines.append(line)
+        lines = ready_runner.read_lines_until_idle()
         
         # Save output
         with open(output_dir / "serial_info.txt", "wb") as f:
-            for line in lines:
-                f.write(line + b"\n")
+            f.write(b"\n".join(lines + [b""]))
         
         # Verify info
-        assert any(b"AI-OS Bootloader" in line for line in lines)
-        assert any(b"Version:" in line for line in lines)
-        assert any(b"Memory:" in line for line in lines)
+        output = b"\n".join(lines)
+        assert b"AI-OS Bootloader" in output
+        assert b"Version:" in output
+        assert b"Memory:" in output
     
-    def test_memory_command(self, qemu_runner, output_dir):
+    def test_memory_command(self, ready_runner, output_dir):
         """Test memory dump command"""
-        boot_image = Path("../src/boot/boot.bin")
-        qemu_runner.start(boot_image)
-        
-        # Wait for boot
-        qemu_runner.read_until("Ready for commands", timeout=2)
-        
         # Send memory command
-        qemu_runner.send('m')
+        ready_runner.send('m')
         
         # Read response (should be hex dump)
-        lines = []
-        for _ in range(3):  # Read a few lines
-            line = qemu_runner.read_line(timeout=1)
-            if line:
-                lines.append(line)
+        lines = ready_runner.read_lines(3, timeout=1)  # Read a few lines
         
         # Save output
         with open(output_dir / "serial_memory.txt", "wb") as f:
-            for line in lines:
-                f.write(line + b"\n")
+            f.write(b"\n".join(lines + [b""]))
         
         # Verify we got hex output
         assert len(lines) > 0, "No memory dump output"
         # First bytes should be 'FA' (cli instruction)
         assert b"FA" in lines[0], "Expected boot sector data"
     
-    def test_cpu_command(self, qemu_runner, output_dir):
+    def test_cpu_command(self, ready_runner, output_dir):
         """Test CPU info command"""
-        boot_image = Path("../src/boot/boot.bin")
-        qemu_runner.start(boot_image)
-        
-        # Wait for boot
-        qemu_runner.read_until("Ready for commands", timeout=2)
-        
         # Send CPU info command
-        qemu_runner.send('c')
+        ready_runner.send('c')
         
         # Read response
-        lines = []
-        for _ in range(5):  # Read several lines
-            line = qemu_runner.read_line(timeout=1)
-            if line:
-                lines.append(line)
+        lines = ready_runner.read_lines_until_idle()
         
         # Save output
         with open(output_dir / "serial_cpu.txt", "wb") as f:
-            for line in lines:
-                f.write(line + b"\n")
+            f.write(b"\n".join(lines + [b""]))
         
         # Verify CPU info output
-        assert any(b"CPU Information" in line for line in lines), "CPU header not found"
+        output = b"\n".join(lines)
+        assert b"CPU Information" in output, "CPU header not found"
         # Should show either vendor info or "CPUID not supported"
-        assert any(b"Vendor:" in line or b"CPUID not supported" in line for line in lines), "No CPU info output"
+        assert b"Vendor:" in output or b"CPUID not supported" in output, "No CPU info output"
     
-    def test_self_test(self, qemu_runner, output_dir):
+    def test_self_test(self, ready_runner, output_dir):
         """Test built-in self test"""
-        boot_image = Path("../src/boot/boot.bin")
-        qemu_runner.start(boot_image)
-        
-        # Wait for boot
-        qemu_runner.read_until("Ready for commands", timeout=2)
-        
         # Run tests
-        qemu_runner.send('t')
+        ready_runner.send('t')
         
         # Read response
-        lines = qemu_runner.read_until("tests passed", timeout=2)
+        lines = ready_runner.read_until("tests passed", timeout=2)
         
         # Save output  
         with open(output_dir / "serial_test.txt", "wb") as f:
-            for line in lines:
-                f.write(line + b"\n")
+            f.write(b"\n".join(lines + [b""]))
         
         # Verify tests passed
         assert any(b"All tests passed" in line for line in lines), "Self tests failed"
     
-    def test_unknown_command(self, qemu_runner, output_dir):
+    def test_unknown_command(self, ready_runner, output_dir):
         """Test error handling for unknown commands"""
-        boot_image = Path("../src/boot/boot.bin")
-        qemu_runner.start(boot_image)
-        
-        # Wait for boot
-        qemu_runner.read_until("Ready for commands", timeout=2)
-        
         # Send unknown command
-        qemu_runner.send('x')
+        ready_runner.send('x')
         
         # Read response
-        response = qemu_runner.read_line(timeout=1)
+        response = ready_runner.read_line(timeout=1)
         
         assert b"ERROR" in response, "No error for unknown command"
     
-    def test_help_command(self, qemu_runner, output_dir):
+    def test_help_command(self, ready_runner, output_dir):
         """Test help command"""
-        boot_image = Path("../src/boot/boot.bin") 
-        qemu_runner.start(boot_image)
-        
-        # Wait for boot
-        qemu_runner.read_until("Ready for commands", timeout=2)
-        
         # Send help
-        qemu_runner.send('h')
+        ready_runner.send('h')
         
         # Read help text
-        lines = []
-        for _ in range(9):  # Expect more lines now with CPU command
-            line = qemu_runner.read_line(timeout=0.5)
-            if line:
-                lines.append(line)
+        lines = ready_runner.read_lines_until_idle()
         
         # Save output
         with open(output_dir / "serial_help.txt", "wb") as f:
-            for line in lines:
-                f.write(line + b"\n")
+            f.write(b"\n".join(lines + [b""]))
         
         # Verify help content
-        assert any(b"Commands:" in line for line in lines)
-        assert any(b"Ping" in line for line in lines)
-        assert any(b"Info" in line for line in lines)
-        assert any(b"CPU info" in line for line in lines), "CPU command not in help"
\ No newline at end of file
+        output = b"\n".join(lines)
+        assert b"Commands:" in output
+        assert b"Ping" in output
+        assert b"Info" in output
+        assert b"CPU info" in output, "CPU command not in help"
\ No newline at end of file